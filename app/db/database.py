@@ -25,11 +25,15 @@ if not DATABASE_URL:
     logger.error("DATABASE_URL environment variable not set!")
     raise ValueError("DATABASE_URL environment variable not set")
 
+# Pre-compiled patterns for rewriting the database URL for asyncpg
+_PG_PREFIX = re.compile(r'^postgresql:')
+_SSL_PARAMS = re.compile(r'[?&]sslmode=require(&channel_binding=require)?')
+
 # Create async database URL by converting postgresql:// to postgresql+asyncpg://
 # And removing ssl parameters that asyncpg doesn't accept in the URL
-base_url = re.sub(r'^postgresql:', 'postgresql+asyncpg:', DATABASE_URL)
+base_url = _PG_PREFIX.sub('postgresql+asyncpg:', DATABASE_URL)
 # Remove ssl parameters that asyncpg doesn't handle in the URL
-ASYNC_DATABASE_URL = re.sub(r'[?&]sslmode=require(&channel_binding=require)?', '', base_url)
+ASYNC_DATABASE_URL = _SSL_PARAMS.sub('', base_url)
 
 # For sync operations (like migrations and some utility functions)
 try:
@@ -50,8 +54,17 @@ try:
         echo=os.getenv("DEBUG", "False").lower() == "true",
         pool_pre_ping=True,
         pool_recycle=300,
+        # Explicit pool sizing instead of SQLAlchemy defaults (5/10), which
+        # exhaust under moderate concurrency; tunable per deployment
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_POOL_OVERFLOW", "40")),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
         connect_args={
-            "ssl": True  # Enable SSL for asyncpg
+            "ssl": True,  # Enable SSL for asyncpg
+            # LRU of prepared statements per connection so repeated CRUD
+            # queries skip Parse/Describe. Set DB_STATEMENT_CACHE_SIZE=0 when
+            # running behind pgbouncer in transaction-pooling mode.
+            "prepared_statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256")),
         }
     )
     
@@ -60,30 +73,33 @@ except Exception as e:
     logger.error(f"Failed to create database engines: {e}")
     raise
 
-# Create session factories
+# Create session factories. SessionLocal is only for code that runs outside
+# the event loop (init scripts and background processing tasks); request
+# handlers must use get_async_db so queries don't trampoline through the
+# thread pool
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
 
-# Dependency for synchronous DB access (used in non-async functions)
-def get_db():
-    db = SessionLocal()
+# Dependency for asynchronous DB access (preferred for FastAPI endpoints).
+# We deliberately use dependency injection rather than middleware-scoped
+# (contextvars) sessions: FastAPI caches the dependency per request, so the
+# auth dependency and the handler share one session, routes that never declare
+# it (e.g. /health) open no session at all, and the try/finally below closes
+# it deterministically even on cancellation.
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Explicit lifecycle instead of relying on the context manager alone:
+    # rollback on any error (including request cancellation, which raises
+    # BaseException) and always close, so sessions never leak back to the
+    # pool in an idle-in-transaction state
+    session = AsyncSessionLocal()
     try:
-        yield db
-    except Exception as e:
-        logger.error(f"Database session error: {e}")
+        yield session
+    except BaseException as e:
+        logger.error(f"Async database session error: {e}")
+        await session.rollback()
         raise
     finally:
-        db.close()
-
-# Dependency for asynchronous DB access (preferred for FastAPI endpoints)
-async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        except Exception as e:
-            logger.error(f"Async database session error: {e}")
-            await session.rollback()
-            raise
+        await session.close()
@@ -38,6 +38,230 @@ def create_tables():
         logger.error(f"Failed to create database tables: {e}")
         return False
 
+def upgrade_vector_index():
+    """Replace a pre-existing IVFFlat embeddings index with the HNSW definition."""
+    logger.info("Checking vector index definition...")
+    try:
+        with engine.connect() as conn:
+            # Convert a legacy fp32 vector column to halfvec (fp16) first, so
+            # the index below can be built with the halfvec op class
+            column_type = conn.execute(text(
+                "SELECT atttypid::regtype::text FROM pg_attribute "
+                "WHERE attrelid = 'embeddings'::regclass AND attname = 'embedding_vector'"
+            )).scalar()
+            if column_type in ('double precision[]', 'real[]', 'numeric[]'):
+                # A float-array column stores each element as a full varlena
+                # datum and can't use the <=> operator; rewrite it through the
+                # pgvector text form into the binary halfvec encoding
+                logger.info("Converting embedding_vector float array to halfvec(1536)...")
+                conn.execute(text("DROP INDEX IF EXISTS idx_embeddings_vector"))
+                conn.execute(text(
+                    "ALTER TABLE embeddings ALTER COLUMN embedding_vector "
+                    "TYPE halfvec(1536) USING "
+                    "('[' || array_to_string(embedding_vector, ',') || ']')::halfvec(1536)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX idx_embeddings_vector ON embeddings "
+                    "USING hnsw (embedding_vector halfvec_cosine_ops) "
+                    "WITH (m = 16, ef_construction = 64)"
+                ))
+                conn.commit()
+                logger.info("embedding_vector float array converted to halfvec")
+                return True
+
+            if column_type and column_type.startswith('vector'):
+                logger.info("Converting embedding_vector column to halfvec(1536)...")
+                conn.execute(text("DROP INDEX IF EXISTS idx_embeddings_vector"))
+                conn.execute(text(
+                    "ALTER TABLE embeddings ALTER COLUMN embedding_vector "
+                    "TYPE halfvec(1536) USING embedding_vector::halfvec(1536)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX idx_embeddings_vector ON embeddings "
+                    "USING hnsw (embedding_vector halfvec_cosine_ops) "
+                    "WITH (m = 16, ef_construction = 64)"
+                ))
+                conn.commit()
+                logger.info("embedding_vector column converted to halfvec")
+                return True
+
+            indexdef = conn.execute(text(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = 'idx_embeddings_vector'"
+            )).scalar()
+            if indexdef and 'ivfflat' in indexdef:
+                logger.info("Found IVFFlat vector index, rebuilding as HNSW...")
+                conn.execute(text("DROP INDEX idx_embeddings_vector"))
+                conn.execute(text(
+                    "CREATE INDEX idx_embeddings_vector ON embeddings "
+                    "USING hnsw (embedding_vector halfvec_cosine_ops) "
+                    "WITH (m = 16, ef_construction = 64)"
+                ))
+                conn.commit()
+                logger.info("Vector index rebuilt as HNSW")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to upgrade vector index: {e}")
+        return False
+
+def ensure_hot_path_indexes():
+    """Create the hot-path filter indexes on databases built before they were declared."""
+    logger.info("Ensuring hot-path indexes exist...")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_chunks_file_id_num "
+                "ON chunks (file_id, chunk_number)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_files_user_id ON files (user_id)"
+            ))
+            # Serves /query/recent: filter by user, newest first, stop at LIMIT
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_query_logs_user_ts "
+                "ON query_logs (user_id, timestamp DESC)"
+            ))
+            conn.commit()
+        logger.info("Hot-path indexes in place")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to create hot-path indexes: {e}")
+        return False
+
+def ensure_total_chunks_counter():
+    """Add the files.total_chunks counter and the trigger that maintains it."""
+    logger.info("Ensuring total_chunks counter column and trigger exist...")
+    try:
+        with engine.connect() as conn:
+            has_column = conn.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'files' AND column_name = 'total_chunks'"
+            )).scalar()
+            if not has_column:
+                conn.execute(text(
+                    "ALTER TABLE files ADD COLUMN total_chunks integer NOT NULL DEFAULT 0"
+                ))
+                # Backfill once from the actual chunk counts
+                conn.execute(text(
+                    "UPDATE files SET total_chunks = sub.cnt "
+                    "FROM (SELECT file_id, count(*) AS cnt FROM chunks GROUP BY file_id) sub "
+                    "WHERE files.id = sub.file_id"
+                ))
+            conn.execute(text("""
+                CREATE OR REPLACE FUNCTION files_total_chunks_sync() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'INSERT' THEN
+                        UPDATE files SET total_chunks = total_chunks + 1 WHERE id = NEW.file_id;
+                        RETURN NEW;
+                    ELSIF TG_OP = 'DELETE' THEN
+                        UPDATE files SET total_chunks = total_chunks - 1 WHERE id = OLD.file_id;
+                        RETURN OLD;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """))
+            conn.execute(text("DROP TRIGGER IF EXISTS trg_files_total_chunks ON chunks"))
+            conn.execute(text(
+                "CREATE TRIGGER trg_files_total_chunks "
+                "AFTER INSERT OR DELETE ON chunks "
+                "FOR EACH ROW EXECUTE FUNCTION files_total_chunks_sync()"
+            ))
+            conn.commit()
+        logger.info("total_chunks counter column and trigger in place")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to set up total_chunks counter: {e}")
+        return False
+
+def upgrade_query_log_chunk_ids():
+    """Convert query_logs.relevant_chunk_ids from a JSON text column to uuid[]."""
+    logger.info("Checking relevant_chunk_ids column type...")
+    try:
+        with engine.connect() as conn:
+            column_type = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'query_logs' AND column_name = 'relevant_chunk_ids'"
+            )).scalar()
+            if column_type and column_type != 'ARRAY':
+                logger.info("Converting relevant_chunk_ids to uuid[]...")
+                # Existing rows hold JSON like ["id", ...]; translate() maps
+                # the brackets to braces and strips the quotes, which is the
+                # Postgres array literal form
+                conn.execute(text(
+                    "ALTER TABLE query_logs ALTER COLUMN relevant_chunk_ids "
+                    "TYPE uuid[] USING nullif(translate(relevant_chunk_ids, '[]\"', '{}'), '')::uuid[]"
+                ))
+                conn.commit()
+                logger.info("relevant_chunk_ids column converted to uuid[]")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to convert relevant_chunk_ids column: {e}")
+        return False
+
+def ensure_text_hash_column():
+    """Add the files.text_sha256 column on databases built before it was declared."""
+    logger.info("Ensuring text_sha256 column exists...")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE files ADD COLUMN IF NOT EXISTS text_sha256 char(64)"
+            ))
+            conn.commit()
+        logger.info("text_sha256 column in place")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to add text_sha256 column: {e}")
+        return False
+
+def ensure_cascade_fks():
+    """Re-create the chunk/embedding foreign keys with ON DELETE CASCADE.
+
+    The models declare the cascades, but create_all never alters existing
+    tables, so databases built before delete_file started relying on them
+    would raise an FK violation on every file delete.
+    """
+    logger.info("Ensuring ON DELETE CASCADE foreign keys exist...")
+    try:
+        with engine.connect() as conn:
+            for table, column, ref_table in (
+                ("chunks", "file_id", "files"),
+                ("embeddings", "chunk_id", "chunks"),
+            ):
+                # Find FKs to the referenced table that don't cascade yet
+                stale = conn.execute(text(
+                    "SELECT conname FROM pg_constraint "
+                    f"WHERE conrelid = '{table}'::regclass AND contype = 'f' "
+                    f"AND confrelid = '{ref_table}'::regclass AND confdeltype <> 'c'"
+                )).scalars().all()
+                for conname in stale:
+                    logger.info(f"Rebuilding {table}.{conname} with ON DELETE CASCADE...")
+                    conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {conname}"))
+                    conn.execute(text(
+                        f"ALTER TABLE {table} ADD CONSTRAINT {conname} "
+                        f"FOREIGN KEY ({column}) REFERENCES {ref_table} (id) ON DELETE CASCADE"
+                    ))
+            conn.commit()
+        logger.info("Cascade foreign keys in place")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to rebuild cascade foreign keys: {e}")
+        return False
+
+def ensure_claimed_at_column():
+    """Add the files.claimed_at column on databases built before it was declared."""
+    logger.info("Ensuring claimed_at column exists...")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE files ADD COLUMN IF NOT EXISTS claimed_at timestamp"
+            ))
+            conn.commit()
+        logger.info("claimed_at column in place")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to add claimed_at column: {e}")
+        return False
+
 def check_connection():
     """Check database connection."""
     logger.info("Checking database connection...")
@@ -66,7 +290,42 @@ def init_db():
     if not tables_success:
         logger.error("Table creation failed.")
         return False
-    
+
+    index_success = upgrade_vector_index()
+    if not index_success:
+        logger.error("Vector index upgrade failed.")
+        return False
+
+    hot_indexes_success = ensure_hot_path_indexes()
+    if not hot_indexes_success:
+        logger.error("Hot-path index creation failed.")
+        return False
+
+    counter_success = ensure_total_chunks_counter()
+    if not counter_success:
+        logger.error("total_chunks counter setup failed.")
+        return False
+
+    cascade_success = ensure_cascade_fks()
+    if not cascade_success:
+        logger.error("Cascade foreign key setup failed.")
+        return False
+
+    hash_column_success = ensure_text_hash_column()
+    if not hash_column_success:
+        logger.error("text_sha256 column setup failed.")
+        return False
+
+    claimed_at_success = ensure_claimed_at_column()
+    if not claimed_at_success:
+        logger.error("claimed_at column setup failed.")
+        return False
+
+    chunk_ids_success = upgrade_query_log_chunk_ids()
+    if not chunk_ids_success:
+        logger.error("relevant_chunk_ids column upgrade failed.")
+        return False
+
     logger.info("Database initialization completed successfully!")
     return True
 
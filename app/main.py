@@ -1,30 +1,61 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import os
 import logging
-from sqlalchemy import text
 
+from . import worker
 from .routers import auth, upload, files, chunks, query, process, admin
-from .db.database import Base, engine, get_db
 from .db.init_db import init_db
+from .utils import vector_search
 
 logger = logging.getLogger(__name__)
 
-# Initialize database and create tables
-try:
-    init_result = init_db()
-    if not init_result:
-        logger.error("Database initialization failed. Application may not function correctly.")
-    else:
-        logger.info("Database initialized successfully")
-except Exception as e:
-    logger.error(f"Error during database initialization: {str(e)}")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Report embedding configuration (real vs mock) once at startup, then
+    # open a warm connection to OpenAI so the first embedding request
+    # doesn't pay the TLS handshake
+    vector_search.configure()
+    await vector_search.warm_up()
+    # Initialize database and create tables once per app startup instead of at
+    # import time. Set RUN_MIGRATIONS=0 to skip the DDL (e.g. on all but one
+    # worker in a preforked deployment).
+    if os.getenv("RUN_MIGRATIONS", "1") == "1":
+        try:
+            init_result = await run_in_threadpool(init_db)
+            if not init_result:
+                logger.error("Database initialization failed. Application may not function correctly.")
+            else:
+                logger.info("Database initialized successfully")
+        except Exception as e:
+            logger.error(f"Error during database initialization: {str(e)}")
+    # Run the file-processing claim loop inside this process so 'Pending'
+    # uploads are picked up without a separate deployment unit. Set
+    # RUN_WORKER=0 when dedicated `python -m app.worker` processes handle
+    # the queue instead.
+    worker_task = None
+    if os.getenv("RUN_WORKER", "1") == "1":
+        worker_task = asyncio.create_task(worker.main())
+    yield
+    if worker_task is not None:
+        worker_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await worker_task
 
 # Initialize FastAPI app
 app = FastAPI(
     title="SAP FICO Vector Database API",
     description="API for uploading, chunking, and querying SAP FICO documents",
     version="0.1.0",
+    lifespan=lifespan,
+    # orjson serializes UUIDs/datetimes natively and is several times faster
+    # than stdlib json on the text-heavy chunk payloads
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -1,5 +1,5 @@
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Text, DateTime, func, JSON, Index
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import relationship
 import uuid
 from datetime import datetime
@@ -10,14 +10,18 @@ from ..db.database import Base
 try:
     import pgvector.sqlalchemy
     # Register pgvector with SQLAlchemy
-    from pgvector.sqlalchemy import Vector
+    from pgvector.sqlalchemy import Vector, HALFVEC
 except ImportError:
-    # If pgvector is not installed, define a placeholder for development
-    # This won't work for actual database operations but allows models to be imported
+    # If pgvector is not installed, define placeholders for development
+    # These won't work for actual database operations but allow models to be imported
     class Vector:
         def __init__(self, dimensions):
             self.dimensions = dimensions
 
+    class HALFVEC:
+        def __init__(self, dimensions):
+            self.dimensions = dimensions
+
 class User(Base):
     __tablename__ = "users"
     
@@ -40,8 +44,11 @@ class File(Base):
     file_type = Column(String)
     file_size = Column(Integer)  # size in bytes
     status = Column(String)  # "Pending", "Embedded", "Stored", "Error"
+    total_chunks = Column(Integer, default=0, nullable=False)  # maintained by trigger on chunks
+    text_sha256 = Column(String(64))  # hash of the extracted text; lets reprocessing skip unchanged files
+    claimed_at = Column(DateTime, nullable=True)  # when a worker claimed the file; lets stale claims be requeued
     upload_date = Column(DateTime, default=datetime.utcnow)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True)
     
     user = relationship("User", back_populates="files")
     chunks = relationship("Chunk", back_populates="file")
@@ -53,18 +60,23 @@ class Chunk(Base):
     chunk_number = Column(Integer)
     text = Column(Text)
     token_count = Column(Integer)
-    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"))
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     file = relationship("File", back_populates="chunks")
     embedding = relationship("Embedding", back_populates="chunk", uselist=False)
 
+    # Composite index covering the hot list query: filter on file_id, order by chunk_number
+    __table_args__ = (
+        Index('ix_chunks_file_id_num', 'file_id', 'chunk_number'),
+    )
+
 class Embedding(Base):
     __tablename__ = "embeddings"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    chunk_id = Column(UUID(as_uuid=True), ForeignKey("chunks.id"), unique=True)
-    embedding_vector = Column(Vector(1536))  # OpenAI embedding size
+    chunk_id = Column(UUID(as_uuid=True), ForeignKey("chunks.id", ondelete="CASCADE"), unique=True)
+    embedding_vector = Column(HALFVEC(1536))  # OpenAI embedding size, stored as fp16 to halve storage/IO
     embedding_model = Column(String)  # e.g., "text-embedding-ada-002"
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -75,9 +87,9 @@ class Embedding(Base):
         Index(
             'idx_embeddings_vector',
             embedding_vector,
-            postgresql_using='ivfflat',  # Use IVFFlat index for larger datasets
-            postgresql_with={'lists': 100},  # Recommended for ~1M vectors
-            postgresql_ops={'embedding_vector': 'vector_cosine_ops'}  # Cosine similarity operations
+            postgresql_using='hnsw',  # HNSW: better recall/latency than IVFFlat, no retraining as data grows
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding_vector': 'halfvec_cosine_ops'}  # Cosine similarity operations
         ),
     )
     
@@ -90,4 +102,9 @@ class QueryLog(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     response = Column(Text, nullable=True)
     response_time = Column(Float, nullable=True)  # in seconds
-    relevant_chunk_ids = Column(Text, nullable=True)  # JSON string of relevant chunk IDs
+    relevant_chunk_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=True)  # chunk IDs returned for the query
+
+    # Composite index covering /query/recent: filter on user_id, newest first
+    __table_args__ = (
+        Index('ix_query_logs_user_ts', 'user_id', timestamp.desc()),
+    )
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from uuid import UUID
 import uuid
 
-from ..db.database import get_db
+from ..db.database import get_async_db
 from ..models.models import User
 from ..schemas.schemas import User as UserSchema, UserCreate, UserUpdate, PasswordReset
 from ..utils.auth import get_current_active_user, get_password_hash
@@ -24,54 +27,55 @@ def get_current_admin_user(current_user: User = Depends(get_current_active_user)
     return current_user
 
 @router.get("/users", response_model=List[UserSchema])
-def get_all_users(
-    db: Session = Depends(get_db),
+async def get_all_users(
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Get all users (admin only)"""
-    users = db.query(User).all()
+    result = await db.execute(select(User))
+    users = result.scalars().all()
     return users
 
 @router.post("/users", response_model=UserSchema)
-def create_user(
+async def create_user(
     user: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Create a new user (admin only)"""
     # Check if user already exists
-    db_user = db.query(User).filter(User.email == user.email).first()
+    result = await db.execute(select(User).where(User.email == user.email))
+    db_user = result.scalar_one_or_none()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create new user
-    hashed_password = get_password_hash(user.password)
-    db_user = User(
+
+    # Create new user in a single INSERT ... RETURNING round trip
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
+    stmt = insert(User).values(
         id=uuid.uuid4(),
         email=user.email,
         hashed_password=hashed_password,
         full_name=user.full_name,
         is_admin=user.is_admin
-    )
-    
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
+    ).returning(User)
+    db_user = (await db.execute(stmt)).scalar_one()
+    await db.commit()
+
     return db_user
 
 @router.put("/users/{user_id}", response_model=UserSchema)
-def update_user(
-    user_id: str,
+async def update_user(
+    user_id: UUID,
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Update user details (admin only)"""
-    db_user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    db_user = result.scalar_one_or_none()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     # Update allowed fields
     if user_update.full_name is not None:
         db_user.full_name = user_update.full_name
@@ -80,73 +84,76 @@ def update_user(
     if user_update.is_admin is not None:
         db_user.is_admin = user_update.is_admin
     if user_update.password is not None:
-        db_user.hashed_password = get_password_hash(user_update.password)
-    
-    db.commit()
-    db.refresh(db_user)
-    
+        db_user.hashed_password = await run_in_threadpool(get_password_hash, user_update.password)
+
+    await db.commit()
+    await db.refresh(db_user)
+
     return db_user
 
 @router.delete("/users/{user_id}")
-def delete_user(
-    user_id: str,
-    db: Session = Depends(get_db),
+async def delete_user(
+    user_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Delete a user (admin only)"""
-    db_user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    db_user = result.scalar_one_or_none()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     # Prevent admin from deleting themselves
     if db_user.id == current_admin.id:
         raise HTTPException(
-            status_code=400, 
+            status_code=400,
             detail="Cannot delete your own account"
         )
-    
-    db.delete(db_user)
-    db.commit()
-    
+
+    await db.delete(db_user)
+    await db.commit()
+
     return {"message": "User deleted successfully"}
 
 @router.put("/users/{user_id}/toggle-admin")
-def toggle_admin_status(
-    user_id: str,
-    db: Session = Depends(get_db),
+async def toggle_admin_status(
+    user_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Toggle admin status for a user (admin only)"""
-    db_user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    db_user = result.scalar_one_or_none()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     # Prevent admin from removing their own admin status
     if db_user.id == current_admin.id:
         raise HTTPException(
-            status_code=400, 
+            status_code=400,
             detail="Cannot modify your own admin status"
         )
-    
+
     db_user.is_admin = not db_user.is_admin
-    db.commit()
-    db.refresh(db_user)
-    
+    await db.commit()
+    await db.refresh(db_user)
+
     return {"message": f"User admin status {'granted' if db_user.is_admin else 'revoked'}", "user": db_user}
 
 @router.put("/users/{user_id}/reset-password")
-def reset_user_password(
-    user_id: str,
+async def reset_user_password(
+    user_id: UUID,
     new_password: PasswordReset,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Reset user password (admin only)"""
-    db_user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    db_user = result.scalar_one_or_none()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    db_user.hashed_password = get_password_hash(new_password.password)
-    db.commit()
-    
+
+    db_user.hashed_password = await run_in_threadpool(get_password_hash, new_password.password)
+    await db.commit()
+
     return {"message": "Password reset successfully"}
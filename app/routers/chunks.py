@@ -1,13 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from typing import List
 
-from ..db.database import get_db
+from ..db.database import get_async_db
 from ..models.models import User, File, Chunk, Embedding
 from ..schemas.schemas import Chunk as ChunkSchema, ChunkWithEmbedding
 from ..utils.auth import get_current_active_user, get_admin_user
 
+# Reusable adapter for bulk row -> schema conversion of the admin listing
+_CHUNK_EMBEDDING_LIST_ADAPTER = TypeAdapter(List[ChunkWithEmbedding])
+
 router = APIRouter(
     prefix="/chunks",
     tags=["chunks"],
@@ -18,55 +23,65 @@ router = APIRouter(
 async def get_all_chunks(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    include_text: bool = False,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_admin_user)  # Admin only endpoint
 ):
     """
     Get all chunks across all files (admin only).
+
+    Chunk text is omitted by default to keep the listing light; pass
+    include_text=1 to fetch the full text blobs.
     """
-    chunks = db.query(Chunk).offset(skip).limit(limit).all()
-    
-    # Create response with embedding info
-    result = []
-    for chunk in chunks:
-        embedding = db.query(Embedding).filter(Embedding.chunk_id == chunk.id).first()
-        
-        chunk_with_embedding = ChunkWithEmbedding(
-            id=chunk.id,
-            chunk_number=chunk.chunk_number,
-            text=chunk.text,
-            token_count=chunk.token_count,
-            file_id=chunk.file_id,
-            created_at=chunk.created_at,
-            embedding_id=embedding.id if embedding else None,
-            embedding_model=embedding.embedding_model if embedding else None
-        )
-        result.append(chunk_with_embedding)
-    
-    return result
+    # Project exactly the response columns in one outer-joined query; no ORM
+    # entities or per-row Python assembly needed
+    columns = [
+        Chunk.id,
+        Chunk.chunk_number,
+        Chunk.token_count,
+        Chunk.file_id,
+        Chunk.created_at,
+        Embedding.id.label("embedding_id"),
+        Embedding.embedding_model,
+    ]
+    if include_text:
+        columns.append(Chunk.text)
+    result = await db.execute(
+        select(*columns)
+        .outerjoin(Embedding, Embedding.chunk_id == Chunk.id)
+        .offset(skip)
+        .limit(limit)
+    )
+
+    return _CHUNK_EMBEDDING_LIST_ADAPTER.validate_python(result.mappings().all())
 
 @router.get("/{chunk_id}", response_model=ChunkWithEmbedding)
 async def get_chunk(
     chunk_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Get a specific chunk by ID.
     """
-    # First, get the chunk
-    chunk = db.query(Chunk).filter(Chunk.id == chunk_id).first()
-    if not chunk:
+    # Fetch the chunk, its file's owner and the embedding info in one joined
+    # query instead of three sequential round trips
+    result = await db.execute(
+        select(Chunk, File.user_id, Embedding.id, Embedding.embedding_model)
+        .join(File, File.id == Chunk.file_id)
+        .outerjoin(Embedding, Embedding.chunk_id == Chunk.id)
+        .where(Chunk.id == chunk_id)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Chunk not found")
-    
+
+    chunk, owner_id, embedding_id, embedding_model = row
+
     # Check if user has access to this chunk's file
-    file = db.query(File).filter(File.id == chunk.file_id).first()
-    if not file or (not current_user.is_admin and file.user_id != current_user.id):
+    if not current_user.is_admin and owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this chunk")
-    
-    # Get embedding information if it exists
-    embedding = db.query(Embedding).filter(Embedding.chunk_id == chunk.id).first()
-    
+
     return ChunkWithEmbedding(
         id=chunk.id,
         chunk_number=chunk.chunk_number,
@@ -74,28 +89,32 @@ async def get_chunk(
         token_count=chunk.token_count,
         file_id=chunk.file_id,
         created_at=chunk.created_at,
-        embedding_id=embedding.id if embedding else None,
-        embedding_model=embedding.embedding_model if embedding else None
+        embedding_id=embedding_id,
+        embedding_model=embedding_model
     )
 
 @router.get("/file/{file_id}", response_model=List[ChunkSchema])
 async def get_file_chunks(
     file_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Get all chunks for a specific file.
     """
     # Check if file exists and user has access
-    file = db.query(File).filter(File.id == file_id).first()
+    result = await db.execute(select(File).where(File.id == file_id))
+    file = result.scalar_one_or_none()
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
+
     if not current_user.is_admin and file.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this file")
-    
+
     # Get chunks for the file
-    chunks = db.query(Chunk).filter(Chunk.file_id == file_id).order_by(Chunk.chunk_number).all()
-    
+    result = await db.execute(
+        select(Chunk).where(Chunk.file_id == file_id).order_by(Chunk.chunk_number)
+    )
+    chunks = result.scalars().all()
+
     return chunks
@@ -1,13 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from typing import List
 
-from ..db.database import get_db
+from pydantic import TypeAdapter
+
+from ..db.database import get_async_db
 from ..models.models import User, File, Chunk
-from ..schemas.schemas import FileResponse, FileDetailResponse
+from ..schemas.schemas import Chunk as ChunkSchema, FileResponse, FileDetailResponse
 from ..utils.auth import get_current_active_user
-from ..utils.file_processing import re_process_file
+
+# Reusable adapter for bulk ORM -> schema conversion; validates the whole list
+# in pydantic's C fast path instead of per-row Python field copies
+_CHUNK_LIST_ADAPTER = TypeAdapter(List[ChunkSchema])
 
 router = APIRouter(
     prefix="/files",
@@ -17,16 +23,17 @@ router = APIRouter(
 
 @router.get("/", response_model=List[FileResponse])
 async def get_all_files(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    # Get all files for the current user
-    files = db.query(File).filter(File.user_id == current_user.id).all()
-    
+    # Get all files for the current user; the chunk count is read from the
+    # trigger-maintained total_chunks counter instead of aggregating
+    result = await db.execute(select(File).where(File.user_id == current_user.id))
+    files = result.scalars().all()
+
     # Create response with chunk count for each file
     response = []
     for file in files:
-        chunk_count = db.query(Chunk).filter(Chunk.file_id == file.id).count()
         response.append(
             FileResponse(
                 id=file.id,
@@ -35,45 +42,49 @@ async def get_all_files(
                 file_size=file.file_size,
                 status=file.status,
                 upload_date=file.upload_date,
-                total_chunks=chunk_count
+                total_chunks=file.total_chunks
             )
         )
-    
+
     return response
 
 @router.get("/{file_id}", response_model=FileDetailResponse)
 async def get_file_details(
     file_id: UUID,
-    db: Session = Depends(get_db),
+    include_text: bool = True,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Get file with specified ID for current user
-    file = db.query(File).filter(
-        File.id == file_id,
-        File.user_id == current_user.id
-    ).first()
-    
+    result = await db.execute(
+        select(File).where(
+            File.id == file_id,
+            File.user_id == current_user.id
+        )
+    )
+    file = result.scalar_one_or_none()
+
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Get chunks for the file
-    db_chunks = db.query(Chunk).filter(Chunk.file_id == file.id).order_by(Chunk.chunk_number).all()
-    
-    # Convert database model objects to Pydantic schema objects
-    from ..schemas.schemas import Chunk as ChunkSchema
-    
-    # Create Pydantic schema objects from database models
-    chunk_schemas = [
-        ChunkSchema(
-            id=chunk.id,
-            chunk_number=chunk.chunk_number,
-            text=chunk.text,
-            token_count=chunk.token_count,
-            file_id=chunk.file_id,
-            created_at=chunk.created_at
-        ) for chunk in db_chunks
-    ]
-    
+
+    # Get chunks for the file; with include_text=0 only the metadata columns
+    # are fetched, avoiding the text blobs entirely
+    if include_text:
+        result = await db.execute(
+            select(Chunk).where(Chunk.file_id == file.id).order_by(Chunk.chunk_number)
+        )
+        chunk_schemas = _CHUNK_LIST_ADAPTER.validate_python(
+            result.scalars().all(), from_attributes=True
+        )
+    else:
+        result = await db.execute(
+            select(
+                Chunk.id, Chunk.chunk_number, Chunk.token_count,
+                Chunk.file_id, Chunk.created_at
+            ).where(Chunk.file_id == file.id).order_by(Chunk.chunk_number)
+        )
+        chunk_schemas = _CHUNK_LIST_ADAPTER.validate_python(result.mappings().all())
+
     return FileDetailResponse(
         id=file.id,
         filename=file.filename,
@@ -85,70 +96,69 @@ async def get_file_details(
         chunks=chunk_schemas
     )
 
+def _remove_file_from_disk(file_path: str):
+    """Delete the physical file if it exists; runs outside the request."""
+    try:
+        import os
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        # Log error but don't fail the background task
+        print(f"Error deleting file: {e}")
+
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: UUID,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    # Get file with specified ID for current user
-    file = db.query(File).filter(
-        File.id == file_id,
-        File.user_id == current_user.id
-    ).first()
-    
-    if not file:
+    # Delete the file row in a single statement; chunks and embeddings go with
+    # it via ON DELETE CASCADE, and RETURNING gives us the path for cleanup
+    result = await db.execute(
+        delete(File)
+        .where(
+            File.id == file_id,
+            File.user_id == current_user.id
+        )
+        .returning(File.file_path)
+    )
+    file_path = result.scalar_one_or_none()
+
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Delete all chunks associated with the file
-    db.query(Chunk).filter(Chunk.file_id == file.id).delete()
-    
-    # Delete file record
-    db.delete(file)
-    db.commit()
-    
-    # Delete physical file if it exists
-    try:
-        import os
-        if os.path.exists(file.file_path):
-            os.remove(file.file_path)
-    except Exception as e:
-        # Log error but don't fail the request
-        print(f"Error deleting file: {e}")
-    
+
+    await db.commit()
+
+    # Unlink the physical file after the response, off the event loop
+    background_tasks.add_task(_remove_file_from_disk, file_path)
+
     return {"message": "File deleted successfully"}
 
 @router.post("/{file_id}/reprocess", response_model=FileResponse)
 async def reprocess_file(
     file_id: UUID,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Get file with specified ID for current user
-    file = db.query(File).filter(
-        File.id == file_id,
-        File.user_id == current_user.id
-    ).first()
-    
+    result = await db.execute(
+        select(File).where(
+            File.id == file_id,
+            File.user_id == current_user.id
+        )
+    )
+    file = result.scalar_one_or_none()
+
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Update file status
+
+    # Mark the file pending; the standalone worker (app/worker.py) claims
+    # 'Pending' rows and reruns the pipeline, where the text-hash check can
+    # still short-circuit an unchanged file
     file.status = "Pending"
-    db.commit()
-    
-    # Re-process file in background
-    background_tasks.add_task(
-        re_process_file,
-        file_id=file.id,
-        file_path=file.file_path,
-        db=db
-    )
-    
-    # Get current chunk count
-    chunk_count = db.query(Chunk).filter(Chunk.file_id == file.id).count()
-    
+    await db.commit()
+
     return FileResponse(
         id=file.id,
         filename=file.filename,
@@ -156,5 +166,5 @@ async def reprocess_file(
         file_size=file.file_size,
         status=file.status,
         upload_date=file.upload_date,
-        total_chunks=chunk_count
+        total_chunks=file.total_chunks
     )
@@ -1,15 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from uuid import UUID
+from uuid import UUID, uuid4
 import os
 
-from ..db.database import get_db, get_async_db
+from ..db.database import get_async_db
 from ..models.models import User, File, Chunk, Embedding
 from ..schemas.schemas import FileResponse, ProcessingResponse
 from ..utils.auth import get_current_active_user
-from ..utils.file_processing import process_file, extract_text_from_file, chunk_text
-from ..utils.vector_search import get_embedding
+from ..utils.file_processing import extract_text_from_file, chunk_text
+from ..utils.vector_search import get_embeddings_batch
 
 router = APIRouter(
     prefix="/process",
@@ -20,8 +20,7 @@ router = APIRouter(
 @router.post("/{file_id}", response_model=ProcessingResponse)
 async def process_file_endpoint(
     file_id: UUID,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -33,35 +32,31 @@ async def process_file_endpoint(
     - Saving the chunks and embeddings to the database with file_id reference
     """
     # Get file with specified ID for current user
-    file = db.query(File).filter(
-        File.id == file_id,
-        File.user_id == current_user.id
-    ).first()
-    
+    result = await db.execute(
+        select(File).where(
+            File.id == file_id,
+            File.user_id == current_user.id
+        )
+    )
+    file = result.scalar_one_or_none()
+
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
+
     # Check if file exists
     if not os.path.exists(file.file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
-    
-    # Update file status
-    file.status = "Processing"
-    db.commit()
-    
-    # Process file in background
-    background_tasks.add_task(
-        process_file,
-        file_id=file.id,
-        file_path=file.file_path,
-        db=db
-    )
-    
+
+    # Mark the file pending; the standalone worker (app/worker.py) claims
+    # 'Pending' rows with FOR UPDATE SKIP LOCKED and runs the pipeline
+    file.status = "Pending"
+    await db.commit()
+
     return ProcessingResponse(
         id=file.id,
         filename=file.filename,
-        status="Processing",
-        message="File processing started in the background"
+        status="Pending",
+        message="File queued for processing"
     )
 
 @router.post("/{file_id}/sync", response_model=ProcessingResponse)
@@ -124,43 +119,42 @@ async def process_file_sync_endpoint(
         )
         await db.commit()
         
-        # Save chunks and generate embeddings
+        # Embed all chunks in one call (get_embeddings_batch shards and runs
+        # the API requests concurrently), then bulk-insert chunks and
+        # embeddings in two executemany statements with one commit
+        from ..utils.file_processing import count_tokens_batch
+
+        embeddings = await get_embeddings_batch(chunks)
+        token_counts = count_tokens_batch(chunks) if chunks else []
+
         chunk_count = 0
-        for i, chunk_text_content in enumerate(chunks):
-            # Count tokens
-            from ..utils.file_processing import count_tokens
-            token_count = count_tokens(chunk_text_content)
-            
-            # Create chunk
-            chunk_id = UUID()
-            await db.execute(
-                Chunk.__table__.insert().values(
-                    id=chunk_id,
-                    chunk_number=i + 1,
-                    text=chunk_text_content,
-                    token_count=token_count,
-                    file_id=file_id
-                )
-            )
-            
-            # Generate embedding
-            embedding_vector = await get_embedding(chunk_text_content)
+        chunk_rows = []
+        embedding_rows = []
+        for i, (chunk_text_content, embedding_vector) in enumerate(zip(chunks, embeddings)):
+            token_count = token_counts[i]
+
+            chunk_id = uuid4()
+            chunk_rows.append({
+                "id": chunk_id,
+                "chunk_number": i + 1,
+                "text": chunk_text_content,
+                "token_count": token_count,
+                "file_id": file_id,
+            })
+
             if embedding_vector:
-                await db.execute(
-                    Embedding.__table__.insert().values(
-                        id=UUID(),
-                        chunk_id=chunk_id,
-                        embedding_vector=embedding_vector,
-                        embedding_model="text-embedding-ada-002"
-                    )
-                )
+                embedding_rows.append({
+                    "id": uuid4(),
+                    "chunk_id": chunk_id,
+                    "embedding_vector": embedding_vector,
+                    "embedding_model": "text-embedding-ada-002",
+                })
                 chunk_count += 1
-            
-            # Commit in batches to avoid large transactions
-            if i % 10 == 0:
-                await db.commit()
-        
-        # Final commit
+
+        if chunk_rows:
+            await db.execute(Chunk.__table__.insert(), chunk_rows)
+        if embedding_rows:
+            await db.execute(Embedding.__table__.insert(), embedding_rows)
         await db.commit()
         
         # Update file status to embedded
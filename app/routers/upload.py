@@ -1,17 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID, uuid4
 import os
-import shutil
 from typing import List
 from datetime import datetime
-import magic
+import aiofiles
 
-from ..db.database import get_db
+from ..db.database import get_async_db
 from ..models.models import User, File as FileModel
 from ..schemas.schemas import FileResponse
 from ..utils.auth import get_current_active_user
-from ..utils.file_processing import process_file
 
 router = APIRouter(
     prefix="/upload",
@@ -23,42 +22,77 @@ UPLOAD_DIR = "uploads"
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Stream uploads to disk in 1 MiB pieces
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Optional defense-in-depth: set UPLOAD_MAGIC_AUDIT=1 to also run libmagic
+# over the sniffed head. The inline signature check below covers the four
+# allowed types without consulting libmagic's full rule database per upload.
+UPLOAD_MAGIC_AUDIT = os.getenv("UPLOAD_MAGIC_AUDIT", "0").lower() in ("1", "true")
+
+# (signature, file type) pairs for the allowed binary formats
+_MAGIC_SIGNATURES = [
+    (b"%PDF", "pdf"),
+    (b"PK\x03\x04", "docx"),         # OOXML zip container
+    (b"\xd0\xcf\x11\xe0", "doc"),    # legacy OLE2 container
+]
+
+def _detect_file_type(head: bytes, filename: str) -> str:
+    """Classify an upload from its leading bytes, or '' when not allowed."""
+    for signature, file_type in _MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return file_type
+    # Text files have no signature; accept them by extension alone
+    if (os.path.splitext(filename or "")[1].lower() == ".txt"):
+        return "txt"
+    return ""
+
 @router.post("/", response_model=FileResponse)
 async def upload_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    # Validate file type
-    content_type = magic.from_buffer(await file.read(2048), mime=True)
-    await file.seek(0)  # Reset file pointer after reading
-    
-    # Check if file type is allowed
-    allowed_types = [
-        "application/pdf",  # PDF files
-        "text/plain",       # TXT files
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # DOCX files
-        "application/msword"  # DOC files (legacy)
-    ]
-    if content_type not in allowed_types:
+    # Validate file type from the leading bytes; they are written out below
+    # rather than rewound, since seek(0) on a SpooledTemporaryFile can force
+    # a full disk spill
+    head = await file.read(2048 if UPLOAD_MAGIC_AUDIT else 8)
+    if not _detect_file_type(head, file.filename):
         raise HTTPException(
             status_code=400,
             detail=f"File type not allowed. Allowed types: PDF, TXT, DOCX"
         )
-    
+
+    if UPLOAD_MAGIC_AUDIT:
+        import magic
+        content_type = magic.from_buffer(head, mime=True)
+        allowed_types = [
+            "application/pdf",  # PDF files
+            "text/plain",       # TXT files
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # DOCX files
+            "application/msword"  # DOC files (legacy)
+        ]
+        if content_type not in allowed_types:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File type not allowed. Allowed types: PDF, TXT, DOCX"
+            )
+
     # Create a unique filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     unique_filename = f"{timestamp}_{file.filename}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    # Save file to uploads directory
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
+
+    # Stream the upload to disk in large async writes so big PDFs don't
+    # block the event loop the way shutil.copyfileobj's sync reads did
+    async with aiofiles.open(file_path, "wb") as buffer:
+        await buffer.write(head)
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
+
     # Determine file extension
     file_extension = os.path.splitext(file.filename)[1].lower()
-    
+
     # Create file record in database
     db_file = FileModel(
         id=uuid4(),
@@ -69,19 +103,14 @@ async def upload_file(
         status="Pending",
         user_id=current_user.id
     )
-    
+
     db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
-    
-    # Process file in background
-    background_tasks.add_task(
-        process_file,
-        file_id=db_file.id,
-        file_path=file_path,
-        db=db
-    )
-    
+    await db.commit()
+    await db.refresh(db_file)
+
+    # The standalone worker (app/worker.py) picks up 'Pending' files, so the
+    # upload response doesn't share its process with the embedding pipeline
+
     return FileResponse(
         id=db_file.id,
         filename=db_file.filename,
@@ -95,21 +124,21 @@ async def upload_file(
 @router.get("/{file_id}/status", response_model=FileResponse)
 async def check_upload_status(
     file_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Get file from database
-    db_file = db.query(FileModel).filter(
-        FileModel.id == file_id, 
-        FileModel.user_id == current_user.id
-    ).first()
-    
+    result = await db.execute(
+        select(FileModel).where(
+            FileModel.id == file_id,
+            FileModel.user_id == current_user.id
+        )
+    )
+    db_file = result.scalar_one_or_none()
+
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Count chunks for the file
-    total_chunks = len(db_file.chunks)
-    
+
     return FileResponse(
         id=db_file.id,
         filename=db_file.filename,
@@ -117,5 +146,5 @@ async def check_upload_status(
         file_size=db_file.file_size,
         status=db_file.status,
         upload_date=db_file.upload_date,
-        total_chunks=total_chunks
+        total_chunks=db_file.total_chunks
     )
@@ -1,54 +1,88 @@
+import asyncio
+import hashlib
 import os
 import uuid
 import logging
-from typing import List
-from sqlalchemy.orm import Session
+from functools import lru_cache
+from typing import List, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 import tiktoken
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from ..db.database import AsyncSessionLocal
 from ..models.models import File, Chunk, Embedding
-from .vector_search import get_embedding
+from .vector_search import get_embeddings_batch
 
 # Configure logging
 logger = logging.getLogger("file_processing")
 
+# Shared tokenizer; building the encoding is expensive (it may download the
+# BPE ranks on first use) so cache it per process instead of per call
+@lru_cache(maxsize=None)
+def _get_encoder():
+    return tiktoken.get_encoding("cl100k_base")  # OpenAI's encoding for text-embedding-ada-002
+
+def _read_txt(file_path: str) -> str:
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+        return file.read()
+
+def _read_pdf(file_path: str) -> str:
+    # Prefer pypdfium2 (PDFium's C++ core, releases the GIL and is several
+    # times faster per page than pure-Python PyPDF2), falling back to PyPDF2
+    # when it isn't installed
+    try:
+        from pypdfium2 import PdfDocument
+        doc = PdfDocument(file_path)
+        try:
+            return "".join(page.get_textpage().get_text_range() for page in doc)
+        finally:
+            doc.close()
+    except ImportError:
+        pass
+    except Exception as e:
+        return f"Error extracting text from PDF: {str(e)}"
+    try:
+        from PyPDF2 import PdfReader
+        reader = PdfReader(file_path)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text()
+        return text
+    except ImportError:
+        # If PyPDF2 is not available, suggest installing it
+        return "Error: PDF processing requires pypdfium2 or PyPDF2. Please install one with 'pip install pypdfium2'."
+    except Exception as e:
+        # Handle other potential errors
+        return f"Error extracting text from PDF: {str(e)}"
+
+def _read_docx(file_path: str) -> str:
+    try:
+        from docx import Document
+        doc = Document(file_path)
+        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+        return text
+    except ImportError:
+        # If python-docx is not available, suggest installing it
+        return "Error: DOCX processing requires python-docx. Please install it with 'pip install python-docx'."
+    except Exception as e:
+        # Handle other potential errors
+        return f"Error extracting text from DOCX: {str(e)}"
+
 # Function to read text from a file
 async def extract_text_from_file(file_path: str) -> str:
-    """Extract text content from a file."""
+    """Extract text content from a file.
+
+    The blocking file parsing runs in a worker thread so the event loop
+    stays free while large PDFs/DOCX are read.
+    """
     file_extension = os.path.splitext(file_path)[1].lower()
-    
+
     if file_extension == '.txt':
-        # For text files, read directly
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-            return file.read()
+        return await asyncio.to_thread(_read_txt, file_path)
     elif file_extension == '.pdf':
-        # For PDF files, use PyPDF2
-        try:
-            from PyPDF2 import PdfReader
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-            return text
-        except ImportError:
-            # If PyPDF2 is not available, suggest installing it
-            return "Error: PDF processing requires PyPDF2. Please install it with 'pip install PyPDF2'."
-        except Exception as e:
-            # Handle other potential errors
-            return f"Error extracting text from PDF: {str(e)}"
+        return await asyncio.to_thread(_read_pdf, file_path)
     elif file_extension in ['.docx', '.doc']:
-        # For Word documents, use python-docx
-        try:
-            from docx import Document
-            doc = Document(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            return text
-        except ImportError:
-            # If python-docx is not available, suggest installing it
-            return "Error: DOCX processing requires python-docx. Please install it with 'pip install python-docx'."
-        except Exception as e:
-            # Handle other potential errors
-            return f"Error extracting text from DOCX: {str(e)}"
+        return await asyncio.to_thread(_read_docx, file_path)
     else:
         # Unsupported file type
         return f"Error: Unsupported file type {file_extension}"
@@ -56,8 +90,12 @@ async def extract_text_from_file(file_path: str) -> str:
 # Function to count tokens in text
 def count_tokens(text: str) -> int:
     """Count the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")  # OpenAI's encoding for text-embedding-ada-002
-    return len(encoding.encode(text))
+    return len(_get_encoder().encode(text))
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """Count tokens for many texts in one parallel tiktoken call."""
+    encoded = _get_encoder().encode_batch(texts, num_threads=os.cpu_count() or 1)
+    return [len(ids) for ids in encoded]
 
 # Function to chunk text into smaller segments
 async def chunk_text(text: str, chunk_size: int = 512, chunk_overlap: int = 50) -> List[str]:
@@ -71,163 +109,191 @@ async def chunk_text(text: str, chunk_size: int = 512, chunk_overlap: int = 50)
     Returns:
         List of text chunks
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=count_tokens,
-    )
-    return text_splitter.split_text(text)
+    # Tokenize once and slice the id array with overlap; the recursive
+    # character splitter re-tokenized the text on every split decision,
+    # which dominated processing time on large documents
+    enc = _get_encoder()
+    ids = await asyncio.to_thread(enc.encode, text)
+    chunks = []
+    step = chunk_size - chunk_overlap
+    for start in range(0, len(ids), step):
+        piece = ids[start:start + chunk_size]
+        chunks.append(enc.decode(piece))
+        if start + chunk_size >= len(ids):
+            break
+    return chunks
 
 # Function to process a file after upload
-async def process_file(file_id: uuid.UUID, file_path: str, db: Session):
-    """Process an uploaded file by extracting text, chunking it, and creating embeddings."""
+async def process_file(file_id: uuid.UUID, file_path: str, db: Optional[AsyncSession] = None):
+    """Process an uploaded file by extracting text, chunking it, and creating embeddings.
+
+    When no session is passed (the BackgroundTasks call sites), a fresh one is
+    opened here: the request-scoped session is closed once the response is
+    sent, so background work must own its session and pooled connection.
+    """
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            await process_file(file_id, file_path, session)
+        return
     try:
         logger.info(f"Starting processing for file ID: {file_id}, path: {file_path}")
-        
+
         # Update file status to processing
-        db_file = db.query(File).filter(File.id == file_id).first()
+        db_file = (await db.execute(select(File).where(File.id == file_id))).scalar_one_or_none()
         if not db_file:
             logger.error(f"File with ID {file_id} not found in database")
             return
-        
+
         db_file.status = "Processing"
-        db.commit()
+        await db.commit()
         logger.info(f"Updated file status to 'Processing' for {db_file.filename}")
-        
-        # Delete existing chunks and embeddings (if any) to avoid issues when reprocessing
-        # First get all chunk IDs for this file
-        chunk_ids = [chunk_id for (chunk_id,) in db.query(Chunk.id).filter(Chunk.file_id == file_id).all()]
-        
-        # Delete embeddings associated with these chunks
-        if chunk_ids:
-            logger.info(f"Found {len(chunk_ids)} existing chunks with potential embeddings to delete")
-            deletion_count = db.query(Embedding).filter(Embedding.chunk_id.in_(chunk_ids)).delete(synchronize_session=False)
-            logger.info(f"Deleted {deletion_count} existing embeddings for file {file_id}")
-        
-        # Now it's safe to delete the chunks
-        logger.info(f"Deleting existing chunks for file {file_id}")
-        db.query(Chunk).filter(Chunk.file_id == file_id).delete()
-        
+
         # Extract text from file
         logger.info(f"Extracting text from {file_path}")
         text = await extract_text_from_file(file_path)
-        
+
         if text.startswith("Error:"):
             db_file.status = "Error"
-            db.commit()
+            await db.commit()
             logger.error(f"Error extracting text from file {file_path}: {text}")
             return
-        
+
         logger.info(f"Successfully extracted text: {len(text)} characters")
-        
+
+        # Skip re-embedding when the extracted text is byte-identical to the
+        # last successful run; embedding is the expensive, network-bound step.
+        # hashlib dispatches to OpenSSL's SHA-NI path on modern x86_64. The
+        # total_chunks guard makes sure we never skip a file whose chunks
+        # were lost even though the hash still matches.
+        text_hash = hashlib.sha256(text.encode()).hexdigest()
+        if db_file.text_sha256 == text_hash and db_file.total_chunks > 0:
+            db_file.status = "Embedded"
+            await db.commit()
+            logger.info(f"Text unchanged for {db_file.filename} (sha256 match), skipping re-embedding")
+            return
+
+        # Delete existing chunks and embeddings (if any) to avoid issues when reprocessing
+        # First get all chunk IDs for this file
+        chunk_ids = (await db.execute(select(Chunk.id).where(Chunk.file_id == file_id))).scalars().all()
+
+        # Delete embeddings associated with these chunks
+        if chunk_ids:
+            logger.info(f"Found {len(chunk_ids)} existing chunks with potential embeddings to delete")
+            result = await db.execute(delete(Embedding).where(Embedding.chunk_id.in_(chunk_ids)))
+            logger.info(f"Deleted {result.rowcount} existing embeddings for file {file_id}")
+
+        # Now it's safe to delete the chunks
+        logger.info(f"Deleting existing chunks for file {file_id}")
+        await db.execute(delete(Chunk).where(Chunk.file_id == file_id))
+
         # Chunk the text
         logger.info("Chunking text content")
         chunks = await chunk_text(text)
         logger.info(f"Text split into {len(chunks)} chunks")
-        
-        # Clear existing chunks for this file if any (for reprocessing)
-        chunk_count = db.query(Chunk).filter(Chunk.file_id == file_id).count()
-        if chunk_count > 0:
-            logger.info(f"Deleting {chunk_count} existing chunks for file ID {file_id}")
-            db.query(Chunk).filter(Chunk.file_id == file_id).delete()
-            db.commit()
-        
-        # Save chunks to database
+
+        # Embed all chunks in one call; get_embeddings_batch shards them and
+        # runs the API requests concurrently. Rows then accumulate in memory
+        # for two bulk inserts.
+        logger.info(f"Processing {len(chunks)} chunks for embedding")
+        embeddings = await get_embeddings_batch(chunks)
+
         successful_embeddings = 0
         failed_embeddings = 0
-        
-        logger.info(f"Processing {len(chunks)} chunks for embedding")
-        for i, chunk_content in enumerate(chunks):
-            token_count = count_tokens(chunk_content)
-            logger.info(f"Processing chunk {i+1}/{len(chunks)}, tokens: {token_count}")
-            
-            # Create chunk
-            chunk = Chunk(
-                id=uuid.uuid4(),
-                chunk_number=i + 1,
-                text=chunk_content,
-                token_count=token_count,
-                file_id=file_id
-            )
-            db.add(chunk)
-            db.flush()  # Flush to get the ID without committing
-            
-            # Generate embedding for the chunk
-            logger.info(f"Generating embedding for chunk {i+1}")
-            try:
-                embedding_vector = await get_embedding(chunk_content)
-                if embedding_vector:
-                    logger.info(f"Embedding generated successfully with {len(embedding_vector)} dimensions")
-                    embedding = Embedding(
-                        id=uuid.uuid4(),
-                        chunk_id=chunk.id,
-                        embedding_vector=embedding_vector,
-                        embedding_model="text-embedding-ada-002"
-                    )
-                    db.add(embedding)
-                    successful_embeddings += 1
-                else:
-                    logger.warning(f"Failed to generate embedding for chunk {i+1} - returned None")
-                    failed_embeddings += 1
-            except Exception as e:
-                logger.error(f"Error generating embedding for chunk {i+1}: {str(e)}")
+        chunk_rows = []
+        embedding_rows = []
+
+        # Tokenize all chunks once, in parallel, rather than per chunk
+        token_counts = count_tokens_batch(chunks) if chunks else []
+
+        for i, (chunk_content, embedding_vector) in enumerate(zip(chunks, embeddings)):
+            token_count = token_counts[i]
+
+            chunk_id = uuid.uuid4()
+            chunk_rows.append({
+                "id": chunk_id,
+                "chunk_number": i + 1,
+                "text": chunk_content,
+                "token_count": token_count,
+                "file_id": file_id,
+            })
+
+            if embedding_vector:
+                embedding_rows.append({
+                    "id": uuid.uuid4(),
+                    "chunk_id": chunk_id,
+                    "embedding_vector": embedding_vector,
+                    "embedding_model": "text-embedding-ada-002",
+                })
+                successful_embeddings += 1
+            else:
+                logger.warning(f"Failed to generate embedding for chunk {i+1}")
                 failed_embeddings += 1
-        
-        # Commit all changes
-        db.commit()
+
+        # Bulk-insert and commit everything once
+        if chunk_rows:
+            await db.execute(Chunk.__table__.insert(), chunk_rows)
+        if embedding_rows:
+            await db.execute(Embedding.__table__.insert(), embedding_rows)
+        await db.commit()
         logger.info(f"Chunk processing complete. Successful embeddings: {successful_embeddings}, Failed: {failed_embeddings}")
-        
-        # Update file status to embedded
+
+        if failed_embeddings:
+            # Some chunks have no embedding (e.g. API failures with mock
+            # fallback disabled). Clear text_sha256 and mark the file Error
+            # so the next reprocess actually re-runs instead of being
+            # short-circuited by the hash guard above.
+            db_file.status = "Error"
+            db_file.text_sha256 = None
+            await db.commit()
+            logger.error(f"File {file_path} processed with {failed_embeddings} missing embeddings, status set to 'Error'")
+            return
+
+        # Update file status to embedded and remember the text hash so an
+        # unchanged file can short-circuit next time
         db_file.status = "Embedded"
-        db.commit()
+        db_file.text_sha256 = text_hash
+        await db.commit()
         logger.info(f"Successfully processed file {file_path}, status updated to 'Embedded'")
-        
+
     except Exception as e:
         # Update file status to error
         logger.error(f"Error processing file {file_path}: {str(e)}", exc_info=True)
-        db_file = db.query(File).filter(File.id == file_id).first()
+        await db.rollback()
+        db_file = (await db.execute(select(File).where(File.id == file_id))).scalar_one_or_none()
         if db_file:
             db_file.status = "Error"
-            db.commit()
+            await db.commit()
             logger.info(f"Updated file status to 'Error' due to exception")
 
 # Function to reprocess an existing file
-async def re_process_file(file_id: uuid.UUID, file_path: str, db: Session):
+async def re_process_file(file_id: uuid.UUID, file_path: str, db: Optional[AsyncSession] = None):
     """Reprocess an existing file by deleting its chunks and embeddings and processing it again."""
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            await re_process_file(file_id, file_path, session)
+        return
     try:
         logger.info(f"Starting reprocessing for file ID: {file_id}, path: {file_path}")
-        
+
         # Check if file exists
-        db_file = db.query(File).filter(File.id == file_id).first()
+        db_file = (await db.execute(select(File).where(File.id == file_id))).scalar_one_or_none()
         if not db_file:
             logger.error(f"File with ID {file_id} not found")
             return
-            
+
         logger.info(f"Reprocessing file: {db_file.filename}")
-        
-        # First get all chunk IDs for this file
-        chunk_ids = [chunk_id for (chunk_id,) in db.query(Chunk.id).filter(Chunk.file_id == file_id).all()]
-        
-        # Delete embeddings associated with these chunks
-        if chunk_ids:
-            logger.info(f"Found {len(chunk_ids)} chunks with potential embeddings to delete")
-            deletion_count = db.query(Embedding).filter(Embedding.chunk_id.in_(chunk_ids)).delete(synchronize_session=False)
-            logger.info(f"Deleted {deletion_count} embeddings for file {file_id}")
-        
-        # Now it's safe to delete the chunks
-        logger.info(f"Deleting existing chunks for file {file_id}")
-        db.query(Chunk).filter(Chunk.file_id == file_id).delete()
-        db.commit()
-        
-        # Process the file again
-        logger.info(f"Starting fresh processing for file ID {file_id}")
+
+        # process_file handles deleting stale chunks/embeddings itself, after
+        # the text-hash check — deleting here first would destroy the chunks
+        # of an unchanged file before the short-circuit can keep them
         await process_file(file_id, file_path, db)
-        
+
     except Exception as e:
         # Update file status to error
         logger.error(f"Error reprocessing file {file_path}: {str(e)}", exc_info=True)
-        db_file = db.query(File).filter(File.id == file_id).first()
+        await db.rollback()
+        db_file = (await db.execute(select(File).where(File.id == file_id))).scalar_one_or_none()
         if db_file:
             db_file.status = "Error"
-            db.commit()
+            await db.commit()
             logger.info(f"Updated file status to 'Error' due to exception")
@@ -1,11 +1,15 @@
+import asyncio
+import base64
+import hashlib
 import os
-import random
 import logging
+import sqlite3
+import threading
+from collections import OrderedDict
 from typing import List, Optional
+import numpy as np
 from dotenv import load_dotenv
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("vector_search")
 
 # Load environment variables
@@ -15,109 +19,490 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 USE_MOCK_EMBEDDINGS = OPENAI_API_KEY is None or OPENAI_API_KEY == ""
 
-# Log OpenAI API key status (safely)
-if USE_MOCK_EMBEDDINGS:
-    logger.warning("No valid OpenAI API key found in environment variables. Will use mock embeddings.")
-    # Print directly to console for debugging
-    print("WARNING: No valid OpenAI API key found. OPENAI_API_KEY environment variable is missing or empty.")
-    print(f"Current value: '{OPENAI_API_KEY}'")
-else:
-    logger.info(f"OpenAI API key loaded. Key starts with: {OPENAI_API_KEY[:5]}... and is {len(OPENAI_API_KEY)} characters long.")
-    # Print directly to console for debugging
-    print(f"INFO: OpenAI API key loaded. Key starts with: {OPENAI_API_KEY[:5]}... and is {len(OPENAI_API_KEY)} characters long.")
-
-# Import OpenAI only if we're not using mock embeddings
+# Whether API failures (after retries) may substitute a mock vector. Off by
+# default: a mock vector silently poisons the index with noise that will
+# never match a real query, so production should surface the error instead
+# and let the failed chunk be reprocessed.
+ALLOW_MOCK_FALLBACK = os.getenv("ALLOW_MOCK_FALLBACK", "0").lower() in ("1", "true")
+
+def configure() -> None:
+    """Log the embedding configuration; called once from app startup.
+
+    Kept out of module import so importing this module (worker, scripts,
+    tests) neither reconfigures the root logger nor prints anything.
+    """
+    if USE_MOCK_EMBEDDINGS:
+        logger.warning("No valid OpenAI API key found in environment variables. Will use mock embeddings.")
+    elif logger.isEnabledFor(logging.INFO):
+        logger.info("OpenAI API key loaded. Key starts with: %s... and is %d characters long.",
+                    OPENAI_API_KEY[:5], len(OPENAI_API_KEY))
+
+async def warm_up() -> None:
+    """Prime the OpenAI connection at startup; called from app startup.
+
+    The first call otherwise pays DNS, TCP and the TLS handshake
+    (~300ms) in a user request. A free models.list() probe opens a
+    keepalive connection in the same pooled client production traffic
+    uses. Best-effort: an unreachable API must not block boot.
+    """
+    if USE_MOCK_EMBEDDINGS:
+        return
+    try:
+        await _client.models.list()
+        logger.info("OpenAI connection pool warmed up")
+    except Exception as e:
+        logger.warning("OpenAI warm-up probe failed: %s", e)
+
+# Bound on concurrently in-flight OpenAI requests; keeps a rate-limited API
+# from queueing unbounded work on our side
+_api_sem = asyncio.Semaphore(int(os.getenv("EMBED_CONCURRENCY", "32")))
+
+# Set up the OpenAI client only if we're not using mock embeddings. One
+# module-level async client over a pooled httpx transport, so every request
+# reuses warm TLS connections instead of paying the handshake per call.
+_client = None
 if not USE_MOCK_EMBEDDINGS:
     try:
-        import openai
-        # Set OpenAI API key
-        openai.api_key = OPENAI_API_KEY
-        logger.info("OpenAI package imported and API key set successfully")
+        import httpx
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            # The SDK retries 429s, timeouts and connection errors with
+            # exponential backoff and jitter; three attempts turns a ~1%
+            # transient-error rate into effectively zero
+            max_retries=3,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+            ),
+        )
+        logger.info("AsyncOpenAI client initialized with pooled HTTP connections")
     except ImportError as e:
-        logger.error(f"Failed to import OpenAI package: {str(e)}")
+        logger.error("Failed to import OpenAI package: %s", e)
         USE_MOCK_EMBEDDINGS = True
     except Exception as e:
-        logger.error(f"Error setting up OpenAI: {str(e)}")
+        logger.error("Error setting up OpenAI: %s", e)
         USE_MOCK_EMBEDDINGS = True
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Inputs packed into one embeddings.create call; the API accepts up to 2048
+# but smaller shards keep individual requests fast and retryable
+EMBEDDING_SHARD_SIZE = 96
+
+# ada-002's input cap, in tokens; truncating by character count either
+# wasted budget or still overflowed depending on the text
+_EMBED_TOKEN_LIMIT = 8191
+
+def _decode_embedding(payload: str) -> np.ndarray:
+    """Decode a base64 embedding from the API into a float32 array.
+
+    With encoding_format="base64" the response carries the raw float32
+    bytes, so one frombuffer pass replaces 1536 boxed Python floats per
+    vector (and the JSON float payload is ~4x larger on the wire). The
+    copy makes the array writable for in-place normalization.
+    """
+    return np.frombuffer(base64.b64decode(payload), dtype=np.float32).copy()
+
+def _truncate_to_token_limit(text: str) -> str:
+    """Clamp text to the model's token limit, preserving whole tokens.
+
+    Texts under 20000 characters can't exceed 8191 tokens (worst realistic
+    case is ~2.4 characters per token), so the common path skips
+    tokenization entirely.
+    """
+    if len(text) <= 20000:
+        return text
+    # Deferred import: file_processing imports this module at load time
+    from .file_processing import _get_encoder
+    enc = _get_encoder()
+    ids = enc.encode(text)
+    if len(ids) <= _EMBED_TOKEN_LIMIT:
+        return text
+    logger.debug("Text too long for embedding (%d tokens), truncating to %d", len(ids), _EMBED_TOKEN_LIMIT)
+    return enc.decode(ids[:_EMBED_TOKEN_LIMIT])
+
+# Content-addressed embedding cache: identical text never hits the API twice
+# (common when the same chunk reappears across document revisions). Layer 1
+# is a small in-process LRU; layer 2 an SQLite file shared by all processes,
+# accessed through asyncio.to_thread so the event loop never blocks on disk
+# I/O. The key includes the model name so a model swap can't return stale
+# vectors. Both layers are best-effort — any cache failure falls through to
+# the API call.
+_EMBED_CACHE_DB = os.getenv(
+    "EMBEDDING_SQLITE_CACHE",
+    os.path.join("uploads", ".embedding_cache", "embeddings.sqlite3")
+)
+_MEM_CACHE_SIZE = 4096
+_mem_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_cache_conn = None
+_cache_conn_lock = threading.Lock()
+
+# Front-side Bloom filter over the SQLite cache's keys: a definite
+# "not cached" answer costs a few bit probes instead of a thread-pool hop
+# plus an SQLite page read — the common case for brand-new chunks in bulk
+# uploads. Seeded from the cache file's keys when the connection first
+# opens (cheaper than persisting the bit array, and never stale); the rare
+# false positive just falls through to the normal SQLite miss.
+_BLOOM_BITS = 1 << 23  # 1 MiB of bits: ~0.1% false positives at ~500k keys
+_BLOOM_K = 7
+_bloom = bytearray(_BLOOM_BITS // 8)
+_bloom_ready = False
+
+def _bloom_indexes(key: str):
+    digest = hashlib.blake2b(key.encode(), digest_size=4 * _BLOOM_K).digest()
+    for i in range(_BLOOM_K):
+        yield int.from_bytes(digest[i * 4:(i + 1) * 4], "little") % _BLOOM_BITS
+
+def _bloom_add(key: str) -> None:
+    for idx in _bloom_indexes(key):
+        _bloom[idx >> 3] |= 1 << (idx & 7)
+
+def _bloom_might_contain(key: str) -> bool:
+    return all(_bloom[idx >> 3] & (1 << (idx & 7)) for idx in _bloom_indexes(key))
+
+def _cache_key(text: str) -> str:
+    return hashlib.sha256(f"{EMBEDDING_MODEL}:{text}".encode()).hexdigest()
+
+def _mem_cache_get(key: str) -> Optional[List[float]]:
+    vec = _mem_cache.get(key)
+    if vec is not None:
+        _mem_cache.move_to_end(key)
+    return vec
+
+def _mem_cache_put(key: str, vec: List[float]) -> None:
+    _mem_cache[key] = vec
+    _mem_cache.move_to_end(key)
+    while len(_mem_cache) > _MEM_CACHE_SIZE:
+        _mem_cache.popitem(last=False)
+
+def _get_cache_conn() -> sqlite3.Connection:
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(_EMBED_CACHE_DB), exist_ok=True)
+        conn = sqlite3.connect(_EMBED_CACHE_DB, check_same_thread=False)
+        # Rows store vectors int8-quantized with one float scale each: 1537
+        # bytes per vector instead of 6144 for float32. A pre-quantization
+        # cache file lacks the scale column; it's only a cache, so drop and
+        # let it refill rather than migrate.
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(embedding_cache)")]
+        if columns and "scale" not in columns:
+            conn.execute("DROP TABLE embedding_cache")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache "
+            "(key TEXT PRIMARY KEY, scale FLOAT, vec BLOB)"
+        )
+        conn.commit()
+        # Seed the Bloom filter with every key already on disk, so lookups
+        # after a restart still short-circuit correctly
+        global _bloom_ready
+        for (key,) in conn.execute("SELECT key FROM embedding_cache"):
+            _bloom_add(key)
+        _bloom_ready = True
+        _cache_conn = conn
+    return _cache_conn
+
+def _cache_get_sync(key: str):
+    with _cache_conn_lock:
+        conn = _get_cache_conn()
+        return conn.execute(
+            "SELECT scale, vec FROM embedding_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+def _cache_put_sync(key: str, scale: float, blob: bytes) -> None:
+    with _cache_conn_lock:
+        conn = _get_cache_conn()
+        conn.execute(
+            "INSERT OR IGNORE INTO embedding_cache (key, scale, vec) VALUES (?, ?, ?)",
+            (key, scale, blob)
+        )
+        conn.commit()
+
+async def _cache_get(key: str) -> Optional[List[float]]:
+    vec = _mem_cache_get(key)
+    if vec is not None:
+        return vec
+    # Once the filter holds the on-disk keys, a negative answer is
+    # authoritative and skips the SQLite probe entirely
+    if _bloom_ready and not _bloom_might_contain(key):
+        return None
+    try:
+        row = await asyncio.to_thread(_cache_get_sync, key)
+        if row is None:
+            return None
+        scale, blob = row
+        # Dequantize back to float32; unit-norm vectors lose well under 0.1%
+        # cosine similarity to int8 rounding
+        vec = (np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale).tolist()
+        _mem_cache_put(key, vec)
+        return vec
+    except Exception as e:
+        logger.warning("Embedding cache read failed: %s", e)
+        return None
+
+async def _cache_put(key: str, vec: List[float]) -> None:
+    _mem_cache_put(key, vec)
+    try:
+        arr = np.asarray(vec, dtype=np.float32)
+        scale = float(np.abs(arr).max()) / 127.0 or 1.0
+        blob = np.round(arr / scale).astype(np.int8).tobytes()
+        await asyncio.to_thread(_cache_put_sync, key, scale, blob)
+        _bloom_add(key)
+    except Exception as e:
+        logger.warning("Embedding cache write failed: %s", e)
+
+# Optional numba kernel for the mock-embedding normalization. Resolved
+# lazily so the heavy numba import is only paid on the first mock embedding,
+# never when real embeddings are configured; False means numba is absent and
+# the NumPy path is used instead.
+_norm_kernel = None
+
+def _get_norm_kernel():
+    global _norm_kernel
+    if _norm_kernel is None:
+        try:
+            import math
+            from numba import njit
+
+            # cache=True persists the compiled code, so the cold ~30s LLVM
+            # compile happens once per machine, not once per process. The
+            # kernel stays strictly 1-D float64: fastmath lets LLVM fuse the
+            # square-sum and scale passes into FMA loops.
+            @njit(cache=True, fastmath=True)
+            def _kernel(v):
+                s = 0.0
+                for i in range(v.size):
+                    s += v[i] * v[i]
+                inv = 1.0 / math.sqrt(s)
+                for i in range(v.size):
+                    v[i] *= inv
+
+            _norm_kernel = _kernel
+            logger.info("numba normalization kernel compiled for mock embeddings")
+        except ImportError:
+            _norm_kernel = False
+    return _norm_kernel
+
+# Pool of pre-normalized unit vectors shared by all 1536-dim mock
+# embeddings: per call drops to a blake2b digest plus one 6 KB row copy
+# instead of drawing and normalizing 1536 Gaussians. Built on first use
+# (~100 MB, mock/dev mode only), power-of-two sized so indexing is a mask.
+_MOCK_POOL_SIZE = 16384
+_mock_pool = None
+
+def _get_mock_pool() -> np.ndarray:
+    global _mock_pool
+    if _mock_pool is None:
+        pool = np.random.default_rng(0).standard_normal((_MOCK_POOL_SIZE, 1536)).astype(np.float32)
+        pool /= np.linalg.norm(pool, axis=1, keepdims=True)
+        _mock_pool = pool
+    return _mock_pool
+
 def get_mock_embedding(text: str, vector_size: int = 1536) -> List[float]:
     """
     Generate a deterministic mock embedding based on the input text.
     For development/testing use only.
-    
+
     Args:
         text: The text to generate a mock embedding for
         vector_size: Size of the embedding vector (default 1536 to match OpenAI's ada-002)
-        
+
     Returns:
         List[float]: A deterministic mock embedding vector
     """
-    # Use the text to seed the random number generator for deterministic results
-    random.seed(text)
-    
-    # Generate mock embedding
-    mock_embedding = [random.uniform(-1, 1) for _ in range(vector_size)]
-    
-    # Normalize the vector
-    magnitude = sum(x**2 for x in mock_embedding) ** 0.5
-    normalized = [x / magnitude for x in mock_embedding]
-    
-    return normalized
-
-async def get_embedding(text: str) -> Optional[List[float]]:
-    """
-    Get an embedding vector for a text using OpenAI's embedding model.
-    Falls back to mock embeddings if OpenAI API key is not available.
-    
-    Args:
-        text: The text to embed
-        
-    Returns:
-        List[float]: The embedding vector or None if the API call fails
+    # Derive the index (or, below, the RNG seed) from a blake2b digest of
+    # the text — stable across processes (unlike hash()/random.seed, which
+    # are salted by PYTHONHASHSEED) so the worker, the API and the embedding
+    # cache all agree on the vector for a given text.
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+    if vector_size == 1536:
+        return _get_mock_pool()[seed & (_MOCK_POOL_SIZE - 1)].tolist()
+
+    # Non-standard sizes take the original draw-and-normalize path;
+    # Gaussian draws give a uniform point on the unit sphere
+    rng = np.random.default_rng(seed)
+    vec = rng.standard_normal(vector_size)
+
+    kernel = _get_norm_kernel()
+    if kernel:
+        kernel(vec)
+    else:
+        vec /= np.linalg.norm(vec)
+
+    return vec.astype(np.float32).tolist()
+
+async def _get_embedding_mock(text: str) -> Optional[List[float]]:
+    """Mock implementation of get_embedding; used when no API key is set.
+
+    Generation is CPU-bound, so it runs on the thread pool rather than
+    blocking the event loop mid-request.
     """
+    if not text or not text.strip():
+        logger.warning("Empty text provided for embedding")
+        return None
+    text = _truncate_to_token_limit(text)
+    return await asyncio.to_thread(get_mock_embedding, text)
+
+async def _get_embedding_openai(text: str) -> Optional[List[float]]:
+    """OpenAI implementation of get_embedding."""
     try:
         # Ensure text is not empty
         if not text or not text.strip():
             logger.warning("Empty text provided for embedding")
             return None
-            
+
         # Truncate if text is too long
-        original_len = len(text)
-        if original_len > 8000:
-            logger.info(f"Text too long for embedding ({original_len} chars), truncating to 8000 chars")
-            text = text[:8000]
-        
-        # Use mock embeddings if OpenAI API key is not available
-        if USE_MOCK_EMBEDDINGS:
-            logger.info("Using mock embeddings for development")
-            mock_result = get_mock_embedding(text)
-            logger.info(f"Successfully generated mock embedding with {len(mock_result)} dimensions")
-            return mock_result
-        
-        # Log attempt to call OpenAI API   
-        logger.info(f"Calling OpenAI API for embedding generation with text length: {len(text)}")
-        
+        text = _truncate_to_token_limit(text)
+
+        # Identical text resolves from the cache without an API round trip
+        key = _cache_key(text)
+        cached = await _cache_get(key)
+        if cached is not None:
+            logger.debug("Embedding cache hit")
+            return cached
+
         try:
             # Call OpenAI API to get embedding
-            response = openai.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
-            
-            # Extract embedding from response
-            embedding = response.data[0].embedding
-            logger.info(f"Successfully generated OpenAI embedding with {len(embedding)} dimensions")
-            return embedding
-            
+            async with _api_sem:
+                response = await _client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=text,
+                    encoding_format="base64"
+                )
+
+            # Decode and normalize once, in float32: one vectorized pass here
+            # instead of per-query renormalization downstream (cosine
+            # similarity is scale-invariant, so stored and query vectors stay
+            # comparable)
+            arr = _decode_embedding(response.data[0].embedding)
+            arr /= np.linalg.norm(arr)
+            logger.debug("Successfully generated OpenAI embedding with %d dimensions", arr.size)
+            vec = arr.tolist()
+            await _cache_put(key, vec)
+            return vec
+
         except AttributeError as e:
-            logger.error(f"OpenAI client initialization or API error: {str(e)}")
+            logger.error("OpenAI client initialization or API error: %s", e)
             logger.error("This might be due to using an older version of the OpenAI library")
             logger.error("Check if you're using the v1.0.0+ of the library which requires different syntax")
             raise
-            
+
     except Exception as e:
-        logger.error(f"Error generating embedding: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        # Fall back to mock embeddings in case of error
+        logger.error("Error generating embedding: %s", e)
+        logger.error("Error type: %s", type(e).__name__)
+        if not ALLOW_MOCK_FALLBACK:
+            # Surface the failure after the client's retries are exhausted
+            # so the chunk stays unembedded and can be reprocessed
+            raise
         logger.warning("Falling back to mock embeddings due to API error")
-        return get_mock_embedding(text)
+        return await asyncio.to_thread(get_mock_embedding, text)
+
+# Selected once at import: whether mock embeddings are in use can't change
+# mid-process, so per-call code skips the branch (and the mock path skips
+# the cache machinery) entirely
+get_embedding = _get_embedding_mock if USE_MOCK_EMBEDDINGS else _get_embedding_openai
+
+async def get_embeddings_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Get embedding vectors for many texts, packing up to EMBEDDING_SHARD_SIZE
+    inputs per OpenAI API call and running the calls concurrently.
+    Falls back to mock embeddings if OpenAI API key is not available.
+
+    Args:
+        texts: The texts to embed
+
+    Returns:
+        List[Optional[List[float]]]: One embedding per input text, or None for
+        texts that could not be embedded (e.g. empty strings)
+    """
+    results: List[Optional[List[float]]] = [None] * len(texts)
+
+    # Drop empty inputs and truncate overlong ones, remembering positions
+    prepared = []
+    positions = []
+    for idx, text in enumerate(texts):
+        if not text or not text.strip():
+            logger.warning("Empty text at position %d provided for embedding", idx)
+            continue
+        prepared.append(_truncate_to_token_limit(text))
+        positions.append(idx)
+
+    if not prepared:
+        return results
+
+    # Use mock embeddings if OpenAI API key is not available; the whole
+    # CPU-bound batch runs in one thread-pool hop off the event loop
+    if USE_MOCK_EMBEDDINGS:
+        logger.info("Using mock embeddings for batch of %d texts", len(prepared))
+        mocks = await asyncio.to_thread(lambda: [get_mock_embedding(t) for t in prepared])
+        for idx, vec in zip(positions, mocks):
+            results[idx] = vec
+        return results
+
+    # Resolve cached texts first; only the misses go to the API
+    keys = [_cache_key(t) for t in prepared]
+    pending = []
+    for offset, key in enumerate(keys):
+        cached = await _cache_get(key)
+        if cached is not None:
+            results[positions[offset]] = cached
+        else:
+            pending.append(offset)
+
+    if not pending:
+        logger.info("Embedding cache hit for all %d texts", len(prepared))
+        return results
+
+    # Shard the misses and fire the API calls concurrently; the module-level
+    # semaphore bounds how many are in flight, and each shard is one HTTP
+    # round trip over the pooled async client
+    shard_starts = list(range(0, len(pending), EMBEDDING_SHARD_SIZE))
+    logger.info(
+        "Calling OpenAI API for batch embedding of %d texts (%d cached) in %d shard(s)",
+        len(pending), len(prepared) - len(pending), len(shard_starts)
+    )
+
+    async def _embed_shard(shard: List[str]):
+        async with _api_sem:
+            return await _client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=shard,
+                encoding_format="base64"
+            )
+
+    responses = await asyncio.gather(
+        *(
+            _embed_shard([prepared[i] for i in pending[start:start + EMBEDDING_SHARD_SIZE]])
+            for start in shard_starts
+        ),
+        return_exceptions=True
+    )
+
+    for start, response in zip(shard_starts, responses):
+        shard_indices = pending[start:start + EMBEDDING_SHARD_SIZE]
+        if isinstance(response, BaseException):
+            logger.error("Error embedding shard at offset %d: %s", start, response)
+            if not ALLOW_MOCK_FALLBACK:
+                # Leave this shard's results as None; callers record those
+                # chunks as failed so they can be reprocessed later
+                continue
+            logger.warning("Falling back to mock embeddings for this shard")
+            mocks = await asyncio.to_thread(
+                lambda: [get_mock_embedding(prepared[i]) for i in shard_indices]
+            )
+            for offset, vec in zip(shard_indices, mocks):
+                results[positions[offset]] = vec
+            continue
+        for item in response.data:
+            # Same base64 decode and float32 normalization as get_embedding,
+            # so stored vectors and query vectors are always directly
+            # comparable
+            arr = _decode_embedding(item.embedding)
+            arr /= np.linalg.norm(arr)
+            offset = shard_indices[item.index]
+            vec = arr.tolist()
+            results[positions[offset]] = vec
+            await _cache_put(keys[offset], vec)
+
+    return results
@@ -0,0 +1,84 @@
+"""File-processing worker.
+
+Pulls files with status 'Pending' from the database and runs the extraction
+and embedding pipeline for them. The FastAPI lifespan starts one claim loop
+per API process by default (RUN_WORKER=0 disables it); extra capacity can be
+added by running standalone workers next to the API with:
+
+    python -m app.worker
+
+Claiming uses FOR UPDATE SKIP LOCKED, so any number of worker processes can
+run in parallel without double-processing a file. Uploads survive restarts:
+a file that was still 'Pending' when a worker died is simply claimed again,
+and a file stuck in 'Processing' longer than WORKER_STALE_SECONDS (its
+worker died mid-file) is requeued by the next claim.
+"""
+import asyncio
+import logging
+import os
+
+from sqlalchemy import text
+
+from .db.database import AsyncSessionLocal
+from .utils.file_processing import process_file
+
+logger = logging.getLogger("worker")
+
+# How many files one worker processes concurrently per claim
+WORKER_BATCH_SIZE = 4
+# Idle sleep between polls when no pending files exist
+WORKER_POLL_SECONDS = 1.0
+# A 'Processing' file older than this is assumed orphaned by a dead worker
+# and claimed again; keep it well above the longest expected file
+WORKER_STALE_SECONDS = float(os.getenv("WORKER_STALE_SECONDS", "900"))
+
+# Claim-and-mark in one statement: the inner select locks up to
+# WORKER_BATCH_SIZE claimable rows (skipping rows another worker holds), the
+# update flips them to Processing so the claim transaction can commit and
+# release the row locks before the long embedding work starts. claimed_at
+# records when the claim happened, which is what makes orphaned 'Processing'
+# rows detectable and reclaimable.
+_CLAIM_SQL = text("""
+    UPDATE files SET status = 'Processing', claimed_at = now()
+    WHERE id IN (
+        SELECT id FROM files
+        WHERE status = 'Pending'
+           OR (status = 'Processing'
+               AND claimed_at < now() - make_interval(secs => :stale))
+        ORDER BY upload_date
+        LIMIT :batch
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, file_path
+""")
+
+async def claim_pending_files(batch_size: int = WORKER_BATCH_SIZE):
+    """Atomically claim up to batch_size claimable files and return their rows."""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            _CLAIM_SQL, {"batch": batch_size, "stale": WORKER_STALE_SECONDS}
+        )).all()
+        await db.commit()
+        return rows
+
+async def main():
+    logger.info(f"Worker started (batch={WORKER_BATCH_SIZE}, poll={WORKER_POLL_SECONDS}s)")
+    while True:
+        try:
+            rows = await claim_pending_files()
+        except Exception as e:
+            logger.error(f"Failed to claim pending files: {e}")
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            continue
+
+        if not rows:
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            continue
+
+        logger.info(f"Claimed {len(rows)} file(s) for processing")
+        # process_file opens its own session per file and never raises
+        await asyncio.gather(*(process_file(row.id, row.file_path) for row in rows))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
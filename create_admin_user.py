@@ -1,48 +1,53 @@
-import requests
-import json
+import asyncio
 import os
+import sys
+import uuid
 from dotenv import load_dotenv
 import argparse
 
-# Load environment variables from .env
+# Load environment variables from .env (DATABASE_URL) before app imports
 load_dotenv()
 
-def create_admin_user(email, password, full_name):
+from sqlalchemy import insert, select
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import User
+from app.utils.auth import get_password_hash
+
+async def create_admin_user(email, password, full_name):
     """
-    Create an admin user in the SAP FICO Uploader backend
+    Create an admin user directly in the database.
+
+    Inserts the row through the app's own session factory and password
+    hashing instead of POSTing to /auth/register, so the API server
+    doesn't need to be running.
     """
-    base_url = "http://localhost:8000"
-    endpoint = f"{base_url}/auth/register"
+    try:
+        async with AsyncSessionLocal() as db:
+            # Same duplicate check the /auth/register handler performs
+            result = await db.execute(select(User).where(User.email == email))
+            if result.scalar_one_or_none():
+                print(f"Error creating admin user: email {email} is already registered")
+                return False
 
-    # Prepare user data
-    user_data = {
-        "email": email,
-        "password": password,
-        "full_name": full_name,
-        "is_admin": True
-    }
+            hashed_password = await asyncio.to_thread(get_password_hash, password)
+            await db.execute(insert(User).values(
+                id=uuid.uuid4(),
+                email=email,
+                hashed_password=hashed_password,
+                full_name=full_name,
+                is_admin=True,
+            ))
+            await db.commit()
 
-    try:
-        # Make the request to create the user
-        response = requests.post(endpoint, json=user_data)
-        response.raise_for_status()  # Raise exception for HTTP errors
-        
-        result = response.json()
         print(f"Admin user created successfully!")
-        print(f"Email: {result['email']}")
-        print(f"Name: {result['full_name']}")
-        print(f"Admin: {result['is_admin']}")
+        print(f"Email: {email}")
+        print(f"Name: {full_name}")
+        print(f"Admin: True")
         print("\nYou can now use these credentials to log in to the application.")
         return True
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         print(f"Error creating admin user: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            try:
-                error_detail = e.response.json().get('detail', 'Unknown error')
-                print(f"Server response: {error_detail}")
-            except:
-                print(f"Status code: {e.response.status_code}")
-                print(f"Response: {e.response.text}")
         return False
 
 if __name__ == "__main__":
@@ -50,7 +55,8 @@ if __name__ == "__main__":
     parser.add_argument("--email", required=True, help="Admin email address")
     parser.add_argument("--password", required=True, help="Admin password")
     parser.add_argument("--name", required=True, help="Admin full name")
-    
+
     args = parser.parse_args()
-    
-    create_admin_user(args.email, args.password, args.name)
+
+    success = asyncio.run(create_admin_user(args.email, args.password, args.name))
+    sys.exit(0 if success else 1)
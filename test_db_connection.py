@@ -1,9 +1,49 @@
 import os
 import asyncio
 import re
+from typing import Optional
 from sqlalchemy import text
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+# Precompiled URL rewrite patterns (asyncpg driver, strip ssl query params)
+_PG_RE = re.compile(r'^postgresql:')
+_SSLMODE_RE = re.compile(r'[?&]sslmode=require(&channel_binding=require)?')
+
+# The asyncpg-flavored URL, rewritten from DATABASE_URL once and memoized
+# so repeat get_engine() calls skip the regex passes entirely
+_async_db_url: Optional[str] = None
+
+def get_async_db_url() -> Optional[str]:
+    global _async_db_url
+    if _async_db_url is None:
+        db_url = os.getenv('DATABASE_URL')
+        if not db_url:
+            return None
+        # Convert to the asyncpg driver and strip the ssl query parameters
+        # that asyncpg doesn't accept in the URL
+        _async_db_url = _SSLMODE_RE.sub('', _PG_RE.sub('postgresql+asyncpg:', db_url))
+    return _async_db_url
+
+# One engine per process: each create_async_engine call spins up a fresh
+# asyncpg pool and TLS handshake, several hundred ms when this pattern gets
+# copied into health checks. echo stays off so the hot path skips SQL
+# statement formatting.
+_engine: Optional[AsyncEngine] = None
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            get_async_db_url(),
+            pool_size=10,
+            pool_pre_ping=True,
+            echo=False,
+            connect_args={
+                "ssl": True  # Enable SSL for asyncpg
+            }
+        )
+    return _engine
 
 # Load environment variables - force reload to ensure we get the latest values
 load_dotenv(override=True)
@@ -39,19 +79,8 @@ async def test_connection() -> None:
     host_part = db_url.split('@')[1].split('/')[0] if '@' in db_url else "unknown"
     print(f"Attempting to connect to: {host_part}")
     
-    # Convert the standard connection string to asyncpg format
-    base_url = re.sub(r'^postgresql:', 'postgresql+asyncpg:', db_url)
-    # Remove ssl parameters that asyncpg doesn't handle in the URL
-    async_db_url = re.sub(r'[?&]sslmode=require(&channel_binding=require)?', '', base_url)
-    
     try:
-        engine = create_async_engine(
-            async_db_url, 
-            echo=True,
-            connect_args={
-                "ssl": True  # Enable SSL for asyncpg
-            }
-        )
+        engine = get_engine()
         async with engine.connect() as conn:
             # Check if pgvector is available
             try:
@@ -71,7 +100,10 @@ async def test_connection() -> None:
             except Exception as e:
                 print(f"Error during database tests: {e}")
         
+        # One-shot script: tear the pool down before exit
+        global _engine
         await engine.dispose()
+        _engine = None
         print("Connection test completed.")
     except Exception as e:
         print(f"Failed to connect to database: {e}")